@@ -3,11 +3,13 @@ use axum::{
         ws::{Message, WebSocket, WebSocketUpgrade},
         Path, State,
     },
-    http::StatusCode,
+    http::{header, HeaderMap, StatusCode},
     response::IntoResponse,
     Json,
 };
 use serde::{Deserialize, Serialize};
+use std::collections::hash_map::DefaultHasher;
+use std::hash::{Hash, Hasher};
 use tokio::io::AsyncWriteExt;
 
 use crate::{
@@ -16,15 +18,22 @@ use crate::{
     state::AppState,
 };
 
+// Borrows the config entry so building the list doesn't clone every
+// server's strings on each poll; the response is serialized while the
+// config read guard is held.
 #[derive(Serialize)]
-pub struct ServerStatus {
+pub struct ServerStatus<'a> {
     #[serde(flatten)]
-    pub config: ServerConfig,
+    pub config: &'a ServerConfig,
     pub status: &'static str,
     #[serde(skip_serializing_if = "Option::is_none")]
     pub pid: Option<u32>,
     #[serde(skip_serializing_if = "Option::is_none")]
     pub uptime_seconds: Option<u64>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub cpu_percent: Option<f32>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub memory_bytes: Option<u64>,
 }
 
 #[derive(Serialize)]
@@ -36,30 +45,63 @@ fn err_response(status: StatusCode, msg: impl Into<String>) -> impl IntoResponse
     (status, Json(ApiError { error: msg.into() }))
 }
 
-pub async fn list_servers(State(state): State<AppState>) -> impl IntoResponse {
+pub async fn list_servers(
+    State(state): State<AppState>,
+    headers: HeaderMap,
+) -> impl IntoResponse {
     let config = state.config.read().await;
-    let result: Vec<ServerStatus> = config
-        .servers
-        .iter()
-        .map(|cfg| {
-            if let Some(inst) = state.servers.get(&cfg.id) {
-                ServerStatus {
-                    config: cfg.clone(),
-                    status: "running",
-                    pid: Some(inst.pid),
-                    uptime_seconds: Some(inst.started_at.elapsed().as_secs()),
-                }
-            } else {
-                ServerStatus {
-                    config: cfg.clone(),
-                    status: "stopped",
-                    pid: None,
-                    uptime_seconds: None,
-                }
-            }
-        })
-        .collect();
-    Json(result)
+    let mut result: Vec<ServerStatus> = Vec::with_capacity(config.servers.len());
+    for cfg in &config.servers {
+        if let Some(inst) = state.servers.get(&cfg.id) {
+            let metrics = inst.last_metrics.lock().await.clone();
+            result.push(ServerStatus {
+                config: cfg,
+                status: "running",
+                pid: Some(inst.pid),
+                uptime_seconds: Some(inst.started_at.elapsed().as_secs()),
+                cpu_percent: metrics.as_ref().map(|m| m.cpu_percent),
+                memory_bytes: metrics.as_ref().map(|m| m.memory_bytes),
+            });
+        } else {
+            result.push(ServerStatus {
+                config: cfg,
+                status: "stopped",
+                pid: None,
+                uptime_seconds: None,
+                cpu_percent: None,
+                memory_bytes: None,
+            });
+        }
+    }
+
+    // Dashboards poll this endpoint; answer 304 when nothing changed so the
+    // common no-change poll skips the response body entirely.
+    let body = match serde_json::to_string(&result) {
+        Ok(body) => body,
+        Err(e) => {
+            return err_response(StatusCode::INTERNAL_SERVER_ERROR, e.to_string()).into_response()
+        }
+    };
+    let mut hasher = DefaultHasher::new();
+    body.hash(&mut hasher);
+    let etag = format!("\"{:016x}\"", hasher.finish());
+
+    if headers
+        .get(header::IF_NONE_MATCH)
+        .and_then(|v| v.to_str().ok())
+        == Some(etag.as_str())
+    {
+        return (StatusCode::NOT_MODIFIED, [(header::ETAG, etag)]).into_response();
+    }
+
+    (
+        [
+            (header::ETAG, etag),
+            (header::CONTENT_TYPE, "application/json".to_string()),
+        ],
+        body,
+    )
+        .into_response()
 }
 
 pub async fn create_server(
@@ -68,7 +110,7 @@ pub async fn create_server(
 ) -> impl IntoResponse {
     {
         let config = state.config.read().await;
-        if config.servers.iter().any(|s| s.id == input.id) {
+        if config.find_server(&input.id).is_some() {
             return err_response(StatusCode::CONFLICT, format!("Server id '{}' already exists", input.id))
                 .into_response();
         }
@@ -98,7 +140,7 @@ pub async fn update_server(
     let is_running = state.servers.contains_key(&id);
     {
         let config = state.config.read().await;
-        let existing = match config.servers.iter().find(|s| s.id == id) {
+        let existing = match config.find_server(&id) {
             Some(s) => s,
             None => {
                 return err_response(StatusCode::NOT_FOUND, format!("Server '{}' not found", id))
@@ -112,6 +154,10 @@ pub async fn update_server(
             )
             .into_response();
         }
+        // Nothing changed; skip the config rewrite (serialize + fsync + rename).
+        if *existing == input {
+            return StatusCode::OK.into_response();
+        }
     }
     if let Err(e) = validate_server_config(&input) {
         return err_response(StatusCode::BAD_REQUEST, e).into_response();
@@ -189,6 +235,33 @@ pub async fn backup_server_handler(
         Err(e) => err_response(StatusCode::INTERNAL_SERVER_ERROR, e).into_response(),
     }
 }
+/// Plain-text dump of the buffered console history, for clients that just
+/// want the tail without opening a websocket or parsing JSON.
+pub async fn get_console(
+    Path(id): Path<String>,
+    State(state): State<AppState>,
+) -> impl IntoResponse {
+    let instance = match state.servers.get(&id).map(|r| r.value().clone()) {
+        Some(i) => i,
+        None => {
+            return err_response(StatusCode::NOT_FOUND, format!("Server '{}' is not running", id))
+                .into_response()
+        }
+    };
+
+    let text = {
+        let buf = instance.console_buffer.lock().await;
+        let mut text = String::with_capacity(buf.iter().map(|l| l.len() + 1).sum());
+        for line in buf.iter() {
+            text.push_str(line);
+            text.push('\n');
+        }
+        text
+    };
+
+    ([(header::CONTENT_TYPE, "text/plain; charset=utf-8")], text).into_response()
+}
+
 pub async fn console_ws(
     ws: WebSocketUpgrade,
     Path(id): Path<String>,
@@ -208,14 +281,15 @@ async fn handle_console_ws(mut socket: WebSocket, id: String, state: AppState) {
         }
     };
 
-    // Send buffered lines
-    {
+    // Send buffered lines. Copy the tail out first so the console reader
+    // tasks aren't blocked on the mutex while we await socket sends.
+    let recent: Vec<String> = {
         let buf = instance.console_buffer.lock().await;
-        let recent: Vec<String> = buf.iter().rev().take(100).cloned().collect();
-        for line in recent.into_iter().rev() {
-            if socket.send(Message::Text(line.into())).await.is_err() {
-                return;
-            }
+        buf.iter().skip(buf.len().saturating_sub(100)).cloned().collect()
+    };
+    for line in recent {
+        if socket.send(Message::Text(line.into())).await.is_err() {
+            return;
         }
     }
 
@@ -279,13 +353,23 @@ async fn handle_metrics_ws(mut socket: WebSocket, id: String, state: AppState) {
     };
 
     let mut metrics_rx = instance.metrics_tx.subscribe();
+
+    // Push the last sample immediately so new clients don't start with an
+    // empty chart until the next sampler tick.
+    let snapshot = instance.last_metrics.lock().await.clone();
+    if let Some(metrics) = snapshot {
+        if let Ok(json) = serde_json::to_string(&metrics) {
+            if socket.send(Message::Text(json.into())).await.is_err() {
+                return;
+            }
+        }
+    }
+
     loop {
         match metrics_rx.recv().await {
-            Ok(metrics) => {
-                if let Ok(json) = serde_json::to_string(&metrics) {
-                    if socket.send(Message::Text(json.into())).await.is_err() {
-                        break;
-                    }
+            Ok(json) => {
+                if socket.send(Message::Text(json.into())).await.is_err() {
+                    break;
                 }
             }
             Err(_) => break,
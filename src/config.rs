@@ -20,7 +20,7 @@ impl Default for AgentConfig {
     }
 }
 
-#[derive(Debug, Clone, Serialize, Deserialize)]
+#[derive(Debug, Clone, PartialEq, Serialize, Deserialize)]
 pub struct ServerConfig {
     pub id: String,
     pub name: String,
@@ -41,6 +41,13 @@ pub struct Config {
     pub servers: Vec<ServerConfig>,
 }
 
+impl Config {
+    /// Looks up a server entry by id.
+    pub fn find_server(&self, id: &str) -> Option<&ServerConfig> {
+        self.servers.iter().find(|s| s.id == id)
+    }
+}
+
 pub async fn load_config() -> anyhow::Result<Config> {
     match tokio::fs::read_to_string(CONFIG_PATH).await {
         Ok(contents) => {
@@ -69,14 +76,11 @@ pub async fn save_config(config: &Config) -> anyhow::Result<()> {
         .await
         .context("Failed to write temp config file")?;
     file.flush().await.context("Failed to flush temp config file")?;
+    // fsync through the handle we already hold before the rename makes the
+    // file visible; no need to reopen it.
+    file.sync_all().await.context("Failed to fsync tmp config file")?;
     drop(file);
 
-    // fsync synchronously before rename
-    {
-        let f = std::fs::File::open(CONFIG_TMP_PATH).context("Failed to open tmp for fsync")?;
-        f.sync_all().context("Failed to fsync tmp config file")?;
-    }
-
     tokio::fs::rename(CONFIG_TMP_PATH, CONFIG_PATH)
         .await
         .context("Failed to rename tmp config to final")?;
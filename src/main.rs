@@ -5,6 +5,7 @@ mod api;
 
 use axum::{
     routing::{delete, get, post, put},
+    serve::ListenerExt,
     Router,
 };
 use tower_http::{cors::CorsLayer, services::ServeDir};
@@ -24,19 +25,27 @@ async fn main() -> anyhow::Result<()> {
     // Kill any orphaned servers from a previous crash
     process::kill_orphaned_servers(&cfg).await;
 
-    let state = state::AppState::new(cfg.clone());
+    // The config is parsed once and handed to the shared state; everything
+    // after this point reads it from there.
+    let state = state::AppState::new(cfg);
 
     // Autostart servers
-    for server in &cfg.servers {
-        if server.autostart {
-            let state2 = state.clone();
-            let id = server.id.clone();
-            tokio::spawn(async move {
-                if let Err(e) = process::start_server(state2, &id).await {
-                    tracing::error!("Autostart failed for '{}': {}", id, e);
-                }
-            });
-        }
+    let autostart_ids: Vec<String> = {
+        let config = state.config.read().await;
+        config
+            .servers
+            .iter()
+            .filter(|s| s.autostart)
+            .map(|s| s.id.clone())
+            .collect()
+    };
+    for id in autostart_ids {
+        let state2 = state.clone();
+        tokio::spawn(async move {
+            if let Err(e) = process::start_server(state2, &id).await {
+                tracing::error!("Autostart failed for '{}': {}", id, e);
+            }
+        });
     }
 
     let app = Router::new()
@@ -48,13 +57,22 @@ async fn main() -> anyhow::Result<()> {
         .route("/api/servers/{id}/stop", post(api::stop_server_handler))
         .route("/api/servers/{id}/restart", post(api::restart_server_handler))
         .route("/api/servers/{id}/backup", post(api::backup_server_handler))
+        .route("/api/servers/{id}/console", get(api::get_console))
         .route("/api/servers/{id}/console/ws", get(api::console_ws))
         .route("/api/servers/{id}/metrics/ws", get(api::metrics_ws))
         .layer(CorsLayer::permissive())
         .with_state(state.clone())
         .fallback_service(ServeDir::new("public"));
 
-    let listener = tokio::net::TcpListener::bind(&bind_address).await?;
+    // Nagle's algorithm adds up to ~40 ms to the small JSON responses and
+    // websocket frames this agent serves; disable it per connection.
+    let listener = tokio::net::TcpListener::bind(&bind_address)
+        .await?
+        .tap_io(|tcp_stream| {
+            if let Err(e) = tcp_stream.set_nodelay(true) {
+                tracing::debug!("Failed to set TCP_NODELAY: {}", e);
+            }
+        });
     tracing::info!("Listening on {}", bind_address);
     
     axum::serve(listener, app)
@@ -63,9 +81,14 @@ async fn main() -> anyhow::Result<()> {
 
     tracing::info!("Shutting down servers...");
     let server_ids: Vec<String> = state.servers.iter().map(|s| s.key().clone()).collect();
-    for id in server_ids {
-        let _ = process::stop_server(state.clone(), &id).await;
-    }
+    // Stop in parallel; serially, N servers could take N * the stop timeout.
+    futures_util::future::join_all(server_ids.into_iter().map(|id| {
+        let state2 = state.clone();
+        async move {
+            let _ = process::stop_server(state2, &id).await;
+        }
+    }))
+    .await;
 
     Ok(())
 }
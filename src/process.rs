@@ -3,27 +3,57 @@ use crate::state::{AppState, Metrics, ServerInstance};
 use std::collections::VecDeque;
 use std::sync::Arc;
 use std::time::{SystemTime, UNIX_EPOCH};
-use sysinfo::{Pid, System};
+use sysinfo::{Pid, ProcessRefreshKind, System, UpdateKind};
 use tokio::io::{AsyncBufReadExt, AsyncWriteExt, BufReader};
 use tokio::sync::{broadcast, Mutex};
 
+/// Lines of console history kept per server for websocket replay.
+const CONSOLE_HISTORY_LINES: usize = 500;
+
 pub async fn kill_orphaned_servers(config: &crate::config::Config) {
-    let sys = System::new_all();
-    for server in &config.servers {
-        for (pid, process) in sys.processes() {
-            let cmd = process.cmd();
-            if cmd.iter().any(|c| c.contains("java")) && cmd.iter().any(|c| c.contains(&server.jar)) {
-                if let Some(cwd) = process.cwd() {
-                    if cwd.to_string_lossy() == server.directory {
-                        tracing::warn!("Found orphaned server '{}' (PID {}), killing it...", server.id, pid);
-                        process.kill();
-                    }
-                }
+    // Matching only needs cmdline and cwd; a new_all() would also pull
+    // disks, networks, users and per-process cpu/memory for every pid.
+    let mut sys = System::new();
+    sys.refresh_processes_specifics(
+        ProcessRefreshKind::new()
+            .with_cmd(UpdateKind::OnlyIfNotSet)
+            .with_cwd(UpdateKind::OnlyIfNotSet),
+    );
+    // Single pass over the process table, matching each candidate against
+    // the configured servers, rather than rescanning every process once per
+    // server.
+    let mut killed: Vec<Pid> = Vec::new();
+    for (pid, process) in sys.processes() {
+        let cmd = process.cmd();
+        if !cmd.iter().any(|c| c.contains("java")) {
+            continue;
+        }
+        if let Some(cwd) = process.cwd() {
+            let cwd = cwd.to_string_lossy();
+            let matched = config
+                .servers
+                .iter()
+                .find(|s| cwd == s.directory && cmd.iter().any(|c| c.contains(&s.jar)));
+            if let Some(server) = matched {
+                tracing::warn!("Found orphaned server '{}' (PID {}), killing it...", server.id, pid);
+                process.kill();
+                killed.push(*pid);
             }
         }
     }
-    // Give them a moment to exit
-    tokio::time::sleep(std::time::Duration::from_secs(2)).await;
+
+    // Wait only as long as the killed processes actually take to exit,
+    // instead of a flat delay on every startup.
+    if killed.is_empty() {
+        return;
+    }
+    for _ in 0..20 {
+        tokio::time::sleep(std::time::Duration::from_millis(100)).await;
+        killed.retain(|pid| sys.refresh_process_specifics(*pid, ProcessRefreshKind::new()));
+        if killed.is_empty() {
+            break;
+        }
+    }
 }
 
 pub async fn start_server(state: AppState, server_id: &str) -> Result<(), String> {
@@ -34,9 +64,7 @@ pub async fn start_server(state: AppState, server_id: &str) -> Result<(), String
     let server_cfg = {
         let config = state.config.read().await;
         config
-            .servers
-            .iter()
-            .find(|s| s.id == server_id)
+            .find_server(server_id)
             .cloned()
             .ok_or_else(|| format!("Server '{}' not found in config", server_id))?
     };
@@ -79,61 +107,32 @@ pub async fn start_server(state: AppState, server_id: &str) -> Result<(), String
         metrics_tx: metrics_tx.clone(),
         console_tx: console_tx.clone(),
         started_at: std::time::Instant::now(),
-        console_buffer: Mutex::new(VecDeque::new()),
+        console_buffer: Mutex::new(VecDeque::with_capacity(CONSOLE_HISTORY_LINES)),
+        last_metrics: Mutex::new(None),
     });
 
     state.servers.insert(server_id.to_string(), instance.clone());
 
-    // Spawn console reader for stdout
-    {
-        let state2 = state.clone();
-        let sid = server_id.to_string();
-        let console_tx2 = console_tx.clone();
-        let instance2 = instance.clone();
-        tokio::spawn(async move {
-            let mut reader = BufReader::new(stdout).lines();
-            while let Ok(Some(line)) = reader.next_line().await {
-                let _ = console_tx2.send(line.clone());
-                let mut buf = instance2.console_buffer.lock().await;
-                buf.push_back(line);
-                if buf.len() > 500 {
-                    buf.pop_front();
-                }
-            }
-            on_process_exit(&state2, &sid).await;
-        });
-    }
-
-    // Spawn console reader for stderr
-    {
-        let state2 = state.clone();
-        let sid = server_id.to_string();
-        let console_tx3 = console_tx.clone();
-        let instance3 = instance.clone();
-        tokio::spawn(async move {
-            let mut reader = BufReader::new(stderr).lines();
-            while let Ok(Some(line)) = reader.next_line().await {
-                let _ = console_tx3.send(line.clone());
-                let mut buf = instance3.console_buffer.lock().await;
-                buf.push_back(line);
-                if buf.len() > 500 {
-                    buf.pop_front();
-                }
-            }
-            on_process_exit(&state2, &sid).await;
-        });
-    }
+    // Pump stdout and stderr into the broadcast channel and the history ring
+    spawn_console_reader(state.clone(), server_id.to_string(), instance.clone(), stdout);
+    spawn_console_reader(state.clone(), server_id.to_string(), instance.clone(), stderr);
 
     // Spawn metrics sampler
     {
         let state2 = state.clone();
         let sid = server_id.to_string();
         let metrics_tx2 = metrics_tx.clone();
+        let instance4 = instance.clone();
         tokio::spawn(async move {
             let mut sys = System::new();
             loop {
                 tokio::time::sleep(std::time::Duration::from_secs(1)).await;
-                let alive = sys.refresh_process(Pid::from_u32(pid));
+                // Only cpu + memory are read from the sample; a full refresh
+                // would also re-parse disk usage and exe per tick.
+                let alive = sys.refresh_process_specifics(
+                    Pid::from_u32(pid),
+                    ProcessRefreshKind::new().with_cpu().with_memory(),
+                );
                 if !alive {
                     on_process_exit(&state2, &sid).await;
                     break;
@@ -150,7 +149,10 @@ pub async fn start_server(state: AppState, server_id: &str) -> Result<(), String
                         memory_bytes: mem,
                         timestamp_ms: ts,
                     };
-                    let _ = metrics_tx2.send(m);
+                    *instance4.last_metrics.lock().await = Some(m.clone());
+                    if let Ok(json) = serde_json::to_string(&m) {
+                        let _ = metrics_tx2.send(json);
+                    }
                 }
             }
         });
@@ -160,6 +162,28 @@ pub async fn start_server(state: AppState, server_id: &str) -> Result<(), String
     Ok(())
 }
 
+fn spawn_console_reader<R>(
+    state: AppState,
+    server_id: String,
+    instance: Arc<ServerInstance>,
+    stream: R,
+) where
+    R: tokio::io::AsyncRead + Unpin + Send + 'static,
+{
+    tokio::spawn(async move {
+        let mut reader = BufReader::new(stream).lines();
+        while let Ok(Some(line)) = reader.next_line().await {
+            let _ = instance.console_tx.send(line.clone());
+            let mut buf = instance.console_buffer.lock().await;
+            buf.push_back(line);
+            if buf.len() > CONSOLE_HISTORY_LINES {
+                buf.pop_front();
+            }
+        }
+        on_process_exit(&state, &server_id).await;
+    });
+}
+
 async fn on_process_exit(state: &AppState, server_id: &str) {
     // Idempotent: only first removal triggers autostart
     if state.servers.remove(server_id).is_none() {
@@ -170,9 +194,7 @@ async fn on_process_exit(state: &AppState, server_id: &str) {
     let autostart = {
         let config = state.config.read().await;
         config
-            .servers
-            .iter()
-            .find(|s| s.id == server_id)
+            .find_server(server_id)
             .map(|s| s.autostart)
             .unwrap_or(false)
     };
@@ -199,35 +221,30 @@ fn autostart_after_delay(
 }
 
 pub async fn stop_server(state: AppState, server_id: &str) -> Result<(), String> {
-    let instance = state
+    // Remove the entry up front: one map operation instead of a lookup plus
+    // a later remove, and on_process_exit then sees the stop as intentional
+    // and won't schedule an autostart restart.
+    let (_, instance) = state
         .servers
-        .get(server_id)
-        .map(|r| r.value().clone())
+        .remove(server_id)
         .ok_or_else(|| format!("Server '{}' is not running", server_id))?;
 
-    // Send "stop" command
-    {
+    // Send "stop" command; if the pipe is already closed the command never
+    // reached the JVM, so don't sit out the graceful-wait window for it.
+    let stop_sent = {
         let mut stdin = instance.stdin.lock().await;
-        let _ = stdin.write_all(b"stop\n").await;
-        let _ = stdin.flush().await;
+        stdin.write_all(b"stop\n").await.is_ok() && stdin.flush().await.is_ok()
+    };
+    if !stop_sent {
+        tracing::warn!("Could not send stop command to '{}', falling back to SIGTERM", server_id);
     }
 
+    // Block on the kernel-level wait instead of polling try_wait every
+    // 500 ms; this returns the moment the JVM exits.
+    let mut child = instance.child.lock().await;
+
     // Wait up to 15 seconds
-    let mut stopped = false;
-    for _ in 0..30 {
-        tokio::time::sleep(std::time::Duration::from_millis(500)).await;
-        let mut child = instance.child.lock().await;
-        match child.try_wait() {
-            Ok(Some(_)) => {
-                stopped = true;
-                break;
-            }
-            Ok(None) => {}
-            Err(e) => {
-                tracing::warn!("try_wait error for '{}': {}", server_id, e);
-            }
-        }
-    }
+    let mut stopped = stop_sent && wait_with_timeout(&mut child, 15, server_id).await;
 
     if !stopped {
         // SIGTERM
@@ -236,43 +253,58 @@ pub async fn stop_server(state: AppState, server_id: &str) -> Result<(), String>
         let _ = signal::kill(NixPid::from_raw(instance.pid as i32), Signal::SIGTERM);
 
         // Wait up to 5 more seconds
-        for _ in 0..10 {
-            tokio::time::sleep(std::time::Duration::from_millis(500)).await;
-            let mut child = instance.child.lock().await;
-            match child.try_wait() {
-                Ok(Some(_)) => {
-                    stopped = true;
-                    break;
-                }
-                _ => {}
-            }
-        }
+        stopped = wait_with_timeout(&mut child, 5, server_id).await;
     }
 
     if !stopped {
-        let mut child = instance.child.lock().await;
         let _ = child.kill().await;
     }
+    drop(child);
 
-    state.servers.remove(server_id);
     tracing::info!("Stopped server '{}'", server_id);
     Ok(())
 }
 
-pub async fn restart_server(state: AppState, server_id: &str) -> Result<(), String> {
-    if state.servers.contains_key(server_id) {
-        stop_server(state.clone(), server_id).await?;
+/// Waits for the child to exit, giving up after `secs` seconds. Returns true
+/// if the process is gone (or can no longer be waited on).
+async fn wait_with_timeout(
+    child: &mut tokio::process::Child,
+    secs: u64,
+    server_id: &str,
+) -> bool {
+    match tokio::time::timeout(std::time::Duration::from_secs(secs), child.wait()).await {
+        Ok(Ok(_)) => true,
+        Ok(Err(e)) => {
+            tracing::warn!("wait error for '{}': {}", server_id, e);
+            true
+        }
+        Err(_) => false,
     }
+}
+
+pub async fn restart_server(state: AppState, server_id: &str) -> Result<(), String> {
+    // stop_server does its own membership check; "not running" just means
+    // there is nothing to stop before starting.
+    let _ = stop_server(state.clone(), server_id).await;
     start_server(state, server_id).await
 }
 
+async fn compressor_available(name: &str) -> bool {
+    tokio::process::Command::new(name)
+        .arg("--version")
+        .stdout(std::process::Stdio::null())
+        .stderr(std::process::Stdio::null())
+        .status()
+        .await
+        .map(|s| s.success())
+        .unwrap_or(false)
+}
+
 pub async fn backup_server(state: AppState, server_id: &str) -> Result<(), String> {
     let server_cfg = {
         let config = state.config.read().await;
         config
-            .servers
-            .iter()
-            .find(|s| s.id == server_id)
+            .find_server(server_id)
             .cloned()
             .ok_or_else(|| format!("Server '{}' not found in config", server_id))?
     };
@@ -287,22 +319,56 @@ pub async fn backup_server(state: AppState, server_id: &str) -> Result<(), Strin
         .await
         .map_err(|e| format!("Failed to create backup directory: {}", e))?;
 
+    // Pick the best compressor on the box: zstd streams multithreaded and
+    // compresses region files considerably smaller than gzip at similar
+    // speed; pigz is parallel gzip; tar's built-in gzip is the last resort.
+    let (extension, compressor) = if compressor_available("zstd").await {
+        ("tar.zst", Some("zstd -T0 -3"))
+    } else if compressor_available("pigz").await {
+        ("tar.gz", Some("pigz"))
+    } else {
+        ("tar.gz", None)
+    };
+
     let timestamp = chrono::Local::now().format("%Y-%m-%d_%H-%M-%S").to_string();
-    let backup_filename = format!("{}_{}.tar.gz", server_id, timestamp);
+    let backup_filename = format!("{}_{}.{}", server_id, timestamp, extension);
     let backup_path = std::path::Path::new(backup_dir).join(&backup_filename);
 
-    // Run tar command
-    let mut cmd = tokio::process::Command::new("tar");
-    cmd.arg("-czf")
-        .arg(&backup_path)
-        .arg("-C")
-        .arg(&server_cfg.directory)
-        .arg(".");
-
-    let output = cmd
-        .output()
-        .await
-        .map_err(|e| format!("Failed to execute tar command: {}", e))?;
+    // Tar arguments. The default blocking factor is 20 (10 KiB records);
+    // 1024 moves data in 512 KiB chunks, far fewer write syscalls on the
+    // multi-MiB region files that dominate a world.
+    let mut tar_args: Vec<std::ffi::OsString> = vec![
+        "-cf".into(),
+        backup_path.clone().into_os_string(),
+        "-b".into(),
+        "1024".into(),
+    ];
+    if let Some(compressor) = compressor {
+        tar_args.push("--use-compress-program".into());
+        tar_args.push(compressor.into());
+    } else {
+        tar_args.push("-z".into());
+    }
+    tar_args.push("-C".into());
+    tar_args.push(server_cfg.directory.clone().into());
+    tar_args.push(".".into());
+
+    // Run the pipeline at lower CPU priority so compression doesn't steal
+    // cycles from running servers; fall back to a plain spawn if nice(1)
+    // isn't available.
+    let mut cmd = tokio::process::Command::new("nice");
+    cmd.arg("-n").arg("10").arg("tar").args(&tar_args);
+    let output = match cmd.output().await {
+        Ok(output) => output,
+        Err(e) if e.kind() == std::io::ErrorKind::NotFound => {
+            tokio::process::Command::new("tar")
+                .args(&tar_args)
+                .output()
+                .await
+                .map_err(|e| format!("Failed to execute tar command: {}", e))?
+        }
+        Err(e) => return Err(format!("Failed to execute tar command: {}", e)),
+    };
 
     if !output.status.success() {
         let stderr = String::from_utf8_lossy(&output.stderr);
@@ -15,10 +15,15 @@ pub struct ServerInstance {
     pub pid: u32,
     pub child: Mutex<tokio::process::Child>,
     pub stdin: Mutex<tokio::process::ChildStdin>,
-    pub metrics_tx: broadcast::Sender<Metrics>,
+    /// Carries each sample pre-serialized to JSON so it is encoded once per
+    /// tick rather than once per connected websocket client.
+    pub metrics_tx: broadcast::Sender<String>,
     pub console_tx: broadcast::Sender<String>,
     pub started_at: std::time::Instant,
     pub console_buffer: Mutex<VecDeque<String>>,
+    /// Most recent sample from the metrics task, for callers that want the
+    /// current value without waiting for the next broadcast tick.
+    pub last_metrics: Mutex<Option<Metrics>>,
 }
 
 #[derive(Clone)]